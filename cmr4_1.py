@@ -8,7 +8,7 @@ from tkcalendar import DateEntry
 from tkinter import filedialog, messagebox
 from tkinter import Spinbox
 from paddleocr import PaddleOCR
-from PIL import Image, ImageTk, ImageDraw
+from PIL import Image, ImageTk, ImageDraw, ImageOps
 import numpy as np
 import io
 from datetime import datetime, timedelta
@@ -18,6 +18,19 @@ import requests
 import uuid
 import shutil
 import webbrowser
+import simsimd
+import pytesseract
+import time
+import multiprocessing
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import repeat
+from abc import ABC, abstractmethod
+import sqlite3
+import pickle
+import hashlib
+import threading
+import zipfile
 
 def resource_path(relative_path):
     try:
@@ -34,20 +47,222 @@ def get_base_path():
 
 CONFIG_FILE = os.path.join(get_base_path(), "config.json")
 
+DEFAULT_ROI = ((0.00, 1.00), (0.30, 0.85))
+
+DEFAULT_CONFIG = {
+    "validation_url": "http://fabriziopesce.atwebpages.com/validate_licenses.php",
+    "source_folder": "",
+    "output_folder": "",
+    "preamble_file": "",
+    "backup_folder": "",
+    "auto_accept_enabled": False,
+    "auto_accept_min_confidence": 0.95,
+    "auto_accept_expected_codes": 0,
+    "auto_accept_datetime_source": "file",
+    "skip_blank_pages": True,
+    "blank_ink_threshold": 0.002,
+    "skip_duplicate_pages": True,
+    "duplicate_max_distance": 6,
+    "duplicate_max_pixel_diff": 0.0002,
+    "barcode_enabled": True,
+    "ocr_mode": "full",
+    "coarse_scale": 0.5,
+    "preprocessing_profile": "max_accuracy",
+    "roi": [list(DEFAULT_ROI[0]), list(DEFAULT_ROI[1])],
+    "roi_cascade_enabled": True,
+    "layout_templates_enabled": True,
+    "layout_match_distance": 0.15,
+    "page_orientation_enabled": True,
+    "concurrency_strategy": "single",
+    "ocr_workers": 2,
+    "ocr_threads": 0,
+    "tile_max_pixels": 8000000,
+    "tile_size": 2048,
+    "tile_overlap": 256,
+    "ocr_batch_pages": 8,
+    "memory_budget_mb": 1536,
+    "review_preview_max_side": 1600,
+    "review_preview_quality": 80,
+    "backup_link_mode": "auto",
+    "backup_workers": 4,
+    "backup_mode": "folder",
+    "backup_include_outputs": False,
+    "backup_manifest": True,
+    "scan_recursive": True,
+    "scan_incremental": True,
+    "image_max_side": 3508,
+    "photo_normalization_enabled": True,
+    "target_text_height": 24,
+    "rec_batch_size": 0,
+    "restrict_charset": True,
+    "skip_non_code_lines": True,
+    "ocr_engines": ["paddle"],
+    "engine_escalation_confidence": 0.85,
+    "tesseract_cmd": "",
+    "inference_backend": "paddle",
+    "enable_mkldnn": True,
+    "onnx_det_model": "",
+    "onnx_rec_model": "",
+    "onnx_cls_model": "",
+    "quantized_models_enabled": False,
+    "quantized_det_model": "",
+    "quantized_rec_model": "",
+    "quantized_min_recall": 0.97,
+    "quantized_validated_models": [],
+}
+
+ENGINE_MIXES = {
+    "PaddleOCR": ["paddle"],
+    "Tesseract + PaddleOCR": ["tesseract", "paddle"],
+    "Tesseract": ["tesseract"],
+}
+
+BENCHMARK_FILE = os.path.join(get_base_path(), "benchmark.json")
+
+def load_benchmark():
+    if os.path.exists(BENCHMARK_FILE):
+        with open(BENCHMARK_FILE, "r") as f:
+            return json.load(f)
+    return {}
+
+def save_benchmark(section, results):
+    benchmark = load_benchmark()
+    benchmark[section] = results
+    with open(BENCHMARK_FILE, "w") as f:
+        json.dump(benchmark, f, indent=2)
+
 def save_config(validation_url, source, output, preamble, backup):
+    update_config(validation_url=validation_url, source_folder=source, output_folder=output, preamble_file=preamble, backup_folder=backup)
+
+def update_config(**values):
+    config = load_config()
+    config.update(values)
     with open(CONFIG_FILE, "w") as f:
-        json.dump({"validation_url": validation_url, "source_folder": source, "output_folder": output, "preamble_file": preamble, "backup_folder": backup}, f)
+        json.dump(config, f, indent=2)
 
 def load_config():
+    config = dict(DEFAULT_CONFIG)
     if os.path.exists(CONFIG_FILE):
         with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {"validation_url": "http://fabriziopesce.atwebpages.com/validate_licenses.php", "source_folder": "", "output_folder": "", "preamble_file": "", "backup_folder": ""}
+            config.update(json.load(f))
+    return config
 
 # ---- UTILS ---- #
 
-ocr = PaddleOCR(use_angle_cls=True, lang='it')
+worker_pool = None
+worker_count = 1
+worker_options = None
+
+CONCURRENCY_STRATEGIES = ("single", "balanced", "many_workers", "manual")
+
+def thread_budget(options, cpus=None):
+    cpus = cpus or os.cpu_count() or 1
+    strategy = options["concurrency_strategy"]
+    if strategy == "many_workers":
+        return cpus, 1
+    if strategy == "balanced":
+        workers = max(1, cpus // 4)
+        return workers, max(1, cpus // workers)
+    if strategy == "manual":
+        workers = max(1, options["ocr_workers"])
+        return workers, options["ocr_threads"] or max(1, cpus // workers)
+    return 1, cpus
+
+def process_threads(options):
+    if multiprocessing.parent_process() is None:
+        return os.cpu_count() or 1
+    return thread_budget(options)[1]
+
+def apply_thread_budget(options):
+    workers, threads = thread_budget(options)
+    cv2.setNumThreads(process_threads(options))
+    configure_worker_pool(workers, options)
+    return workers, threads
+
+def configure_worker_pool(workers, options=None):
+    global worker_pool, worker_count, worker_options
+    if worker_pool is not None and (workers != worker_count or backend_key(options) != backend_key(worker_options)):
+        worker_pool.shutdown()
+        worker_pool = None
+    worker_count = workers
+    worker_options = options
+
+def init_ocr_worker(options):
+    apply_thread_budget(options)
+    configure_backend(options)
+
+def configure_rec_batch(size=0):
+    ocr.text_recognizer.rec_batch_num = size or max(6, (os.cpu_count() or 1) * 4)
+
+def get_worker_pool():
+    global worker_pool
+    if worker_pool is None and worker_count > 1:
+        worker_pool = ProcessPoolExecutor(max_workers=worker_count, initializer=init_ocr_worker, initargs=(worker_options,))
+    return worker_pool
+
+def spool_window(array):
+    if not isinstance(array, np.memmap) or array.filename is None or array.ndim != 2:
+        return None
+    offset = array.ctypes.data - np.frombuffer(array._mmap, dtype=np.uint8).ctypes.data
+    return array.filename, offset, array.shape, array.strides
+
+def attach_window(handle):
+    path, offset, shape, strides = handle
+    extent = offset + (shape[0] - 1) * strides[0] + (shape[1] - 1) * strides[1] + 1
+    mapped = np.memmap(path, dtype=np.uint8, mode="r", offset=0, shape=(extent,))
+    return np.lib.stride_tricks.as_strided(mapped[offset:], shape=shape, strides=strides)
+
+def quantized_models_active(options):
+    if not options["quantized_models_enabled"]:
+        return False
+    return options["quantized_validated_models"] == [options["quantized_det_model"], options["quantized_rec_model"]]
+
+def backend_key(options):
+    if options is None:
+        return None
+    return options["inference_backend"], options["enable_mkldnn"], quantized_models_active(options), thread_budget(options)[1]
+
+def create_ocr(options):
+    kwargs = {"use_angle_cls": True, "lang": "it", "cpu_threads": process_threads(options)}
+    if options["inference_backend"] != "onnx":
+        kwargs.update(enable_mkldnn=options["enable_mkldnn"])
+    else:
+        if not all(options[name] for name in ("onnx_det_model", "onnx_rec_model", "onnx_cls_model")):
+            raise ValueError("Modelli ONNX non configurati")
+        kwargs.update(
+            use_onnx=True,
+            det_model_dir=options["onnx_det_model"],
+            rec_model_dir=options["onnx_rec_model"],
+            cls_model_dir=options["onnx_cls_model"],
+        )
+    if quantized_models_active(options):
+        kwargs.update(det_model_dir=options["quantized_det_model"], rec_model_dir=options["quantized_rec_model"])
+    return PaddleOCR(**kwargs)
+
+def configure_backend(options):
+    global ocr, ocr_backend, backend_warning
+    if backend_key(options) != ocr_backend:
+        try:
+            ocr = create_ocr(options)
+        except Exception as e:
+            if options["inference_backend"] == "paddle":
+                raise
+            backend_warning = f"Backend {options['inference_backend']} non disponibile ({e}), uso PaddleOCR."
+            print(backend_warning)
+            options = {**options, "inference_backend": "paddle"}
+            if backend_key(options) != ocr_backend:
+                ocr = create_ocr(options)
+        ocr_backend = backend_key(options)
+    configure_rec_batch(options["rec_batch_size"])
+
+ocr = None
+ocr_backend = None
+backend_warning = None
+apply_thread_budget(load_config())
+configure_backend(load_config())
 print(f"Model dir: {ocr.args.det_model_dir}")
+barcode_detector = cv2.barcode.BarcodeDetector()
+qr_detector = cv2.QRCodeDetector()
 
 def extract_numbers(text, combined_regex):
     return re.findall(combined_regex, text)
@@ -59,11 +274,34 @@ def preprocess_image(path):
     image = cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
     return image
 
-def save_image_as_pdf_pil(image_path, output_path):
-    image = Image.open(image_path).convert("RGB")
+def save_image_as_pdf_pil(image, output_path):
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    image = image.convert("RGB")
     image = image.resize((595, 842), Image.LANCZOS)
     image.save(output_path, "PDF", resolution=100.0)
 
+def save_pod_pdfs(image, output_dir, numbers, timestamp):
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for number in numbers:
+        if number.strip():
+            output_pdf = os.path.join(output_dir, f"POD_{number}_{timestamp}.pdf")
+            save_image_as_pdf_pil(image, output_pdf)
+            outputs.append(output_pdf)
+    return outputs
+
+DATE_REGEX = re.compile(r"\b(\d{2})[/\-.](\d{2})[/\-.](\d{4})(?:\s+(\d{2})[:.](\d{2}))?")
+
+def extract_datetime(text):
+    for match in DATE_REGEX.finditer(text):
+        day, month, year, hours, minutes = match.groups()
+        try:
+            return datetime(int(year), int(month), int(day), int(hours or 0), int(minutes or 0))
+        except ValueError:
+            continue
+    return None
+
 def pdf_to_images(pdf_path, zoom_factor=3):
     images = []
     doc = fitz.open(pdf_path)
@@ -77,45 +315,1157 @@ def pdf_to_images(pdf_path, zoom_factor=3):
     doc.close()
     return images
 
-def crop_to_roi(image: Image.Image, x_perc=(0.00, 1.00), y_perc=(0.30, 0.85)):
-    width, height = image.size
-    x1 = int(width * x_perc[0])
-    x2 = int(width * x_perc[1])
-    y1 = int(height * y_perc[0])
-    y2 = int(height * y_perc[1])
-    return image.crop((x1, y1, x2, y2))
-
-def image_to_numbers(image_path, combined_regex):
-    image = Image.open(image_path)
-    cropped = crop_to_roi(image)
-    
-    image_np = cv2.cvtColor(np.array(cropped), cv2.COLOR_RGB2GRAY)
-    image_np = cv2.resize(image_np, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+def open_pdf(pdf):
+    if isinstance(pdf, bytes):
+        return fitz.open(stream=pdf, filetype="pdf")
+    return fitz.open(pdf)
+
+def iter_pdf_pages(pdf_path, zoom_factor=3):
+    doc = open_pdf(pdf_path)
+    print(f"Numero pagine PDF: {doc.page_count}")
+    mat = fitz.Matrix(zoom_factor, zoom_factor)
+    try:
+        for page in doc:
+            pix = page.get_pixmap(matrix=mat, alpha=False, colorspace=fitz.csRGB)
+            yield Image.frombytes("RGB", (pix.width, pix.height), pix.samples_mv)
+    finally:
+        doc.close()
+
+JPEG_FORMATS = ("JPEG", "MPO")
+
+def decode_reduced(image, max_side):
+    if image.format in JPEG_FORMATS and max_side and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image.draft("RGB", (round(image.width * scale), round(image.height * scale)))
+    return image
+
+def estimate_text_height(gray):
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    count, labels, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    glyphs = heights[(heights >= 3) & (heights <= gray.shape[0] / 20) & (widths <= heights * 3)]
+    return float(np.median(glyphs)) if len(glyphs) >= 50 else None
+
+def probe_text_scale(image_file, target_text_height, probe_side=1024):
+    if hasattr(image_file, "seek"):
+        image_file.seek(0)
+    with Image.open(image_file) as probe:
+        if probe.format not in JPEG_FORMATS:
+            return None
+        full_side = max(probe.size)
+        probe.draft("L", (max(1, probe.width * probe_side // full_side), max(1, probe.height * probe_side // full_side)))
+        gray = probe.convert("L")
+    gray.thumbnail((probe_side, probe_side))
+    text_height = estimate_text_height(np.array(gray))
+    if text_height is None:
+        return None
+    return min(1.0, target_text_height / (text_height * full_side / max(gray.size)))
+
+def decode_page(image, max_side, text_scale=None):
+    if text_scale is None:
+        return decode_reduced(image, max_side)
+    if text_scale >= 1:
+        return image
+    size = (max(1, round(image.width * text_scale)), max(1, round(image.height * text_scale)))
+    if image.format in JPEG_FORMATS:
+        image.draft("RGB", size)
+    return image if image.size == size else image.resize(size, Image.LANCZOS)
+
+def safe_member_name(name):
+    parts = name.replace("\\", "/").split("/")
+    if parts:
+        parts[0] = re.sub(r"^[A-Za-z]:", "", parts[0])
+    return "/".join(part for part in parts if part not in ("", ".", ".."))
+
+def source_document(source):
+    if source.get("member") is None:
+        return source["path"]
+    with zipfile.ZipFile(source["path"]) as archive:
+        return archive.read(source["member"])
+
+def load_source_page(source, zoom_factor=3):
+    document = source_document(source)
+    if not (source.get("member") or source["path"]).lower().endswith(".pdf"):
+        with Image.open(io.BytesIO(document) if isinstance(document, bytes) else document) as image:
+            image.seek(source["page"] or 0)
+            exif_rotated = image.getexif().get(0x0112, 1) != 1
+            image = decode_page(image, source.get("max_side"), source.get("text_scale"))
+            image = (ImageOps.exif_transpose(image) if exif_rotated else image).convert("RGB")
+    else:
+        doc = open_pdf(document)
+        pix = doc[source["page"]].get_pixmap(matrix=fitz.Matrix(zoom_factor, zoom_factor), alpha=False, colorspace=fitz.csRGB)
+        image = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+        doc.close()
+    if source["rotation"]:
+        image = image.rotate(source["rotation"], expand=True)
+    return image
+
+def page_preview(image, max_side=1600, quality=80):
+    scale = min(1.0, max_side / max(image.size))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if scale < 1:
+        image = image.resize((round(image.width * scale), round(image.height * scale)), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), scale
+
+def pdf_page_info(pdf_path, with_text=False):
+    doc = open_pdf(pdf_path)
+    pages = [{"rotation": page.rotation, "text": page.get_text() if with_text else ""} for page in doc]
+    doc.close()
+    return pages
+
+def page_thumbnail(image, size=512):
+    thumb = image.convert("L")
+    thumb.thumbnail((size, size))
+    return np.array(thumb)
+
+def ink_coverage(thumb, margin=0.05, contrast=50):
+    h, w = thumb.shape
+    inner = thumb[int(h * margin):int(h * (1 - margin)), int(w * margin):int(w * (1 - margin))]
+    background = np.median(inner)
+    return float(np.mean(inner < background - contrast))
+
+def code_band(thumb, y_perc=(0.30, 0.85)):
+    h = thumb.shape[0]
+    return thumb[int(h * y_perc[0]):int(h * y_perc[1])]
+
+def perceptual_hash(thumb, hash_size=16):
+    small = cv2.resize(code_band(thumb), (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA).astype(np.float32)
+    dct = cv2.dct(small)[:hash_size, :hash_size]
+    return np.packbits((dct > np.median(dct)).flatten())
+
+def band_difference(band, other, contrast=50):
+    if band.shape != other.shape:
+        other = cv2.resize(other, (band.shape[1], band.shape[0]), interpolation=cv2.INTER_AREA)
+    return float(np.mean(cv2.absdiff(band, other) > contrast))
+
+def decode_barcodes(image_np, combined_regex):
+    hits = []
+    for detector in (barcode_detector, qr_detector):
+        try:
+            ok, decoded_info, points, _ = detector.detectAndDecodeMulti(image_np)
+        except cv2.error:
+            continue
+        if not ok or points is None:
+            continue
+        for text, box in zip(decoded_info, points):
+            for token in re.split(r"[^0-9A-Za-z]+", text or ""):
+                for num in extract_numbers(token, combined_regex):
+                    hits.append((num, box.astype(int).tolist()))
+    return hits
+
+def is_sideways(thumb, contrast=50, ratio=1.5):
+    ink = (thumb < np.median(thumb) - contrast).astype(np.float32)
+    row_profile, col_profile = ink.sum(axis=1), ink.sum(axis=0)
+    row_score = row_profile.var() / max(row_profile.mean() ** 2, 1e-6)
+    col_score = col_profile.var() / max(col_profile.mean() ** 2, 1e-6)
+    return col_score > row_score * ratio
+
+def is_upside_down(thumb, max_lines=8):
+    detected = ocr.ocr(cv2.cvtColor(thumb, cv2.COLOR_GRAY2BGR), det=True, rec=False, cls=False)[0] or []
+    crops = []
+    for box in sorted(detected, key=lambda b: cv2.boundingRect(np.array(b, dtype=np.float32))[2], reverse=True)[:max_lines]:
+        x, y, w, h = cv2.boundingRect(np.array(box, dtype=np.float32))
+        if w > h:
+            crops.append(cv2.cvtColor(thumb[y:y + h, x:x + w], cv2.COLOR_GRAY2BGR))
+    if not crops:
+        return False
+
+    _, votes, _ = ocr.text_classifier(crops)
+    flipped = sum(score for label, score in votes if label == "180")
+    upright = sum(score for label, score in votes if label == "0")
+    return flipped > upright
+
+def detect_orientation(image):
+    return 90 if is_sideways(page_thumbnail(image, 1024)) else 0
+
+def gray_thumbnail(gray, size=1024):
+    scale = min(1.0, size / max(gray.shape))
+    if scale == 1:
+        return np.ascontiguousarray(gray)
+    return cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def rotate_preview(preview, quality=80):
+    image = Image.open(io.BytesIO(preview[0])).rotate(180)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality, optimize=True)
+    return buffer.getvalue(), preview[1]
+
+CODE_ASPECT_RANGE = (2.5, 30.0)
+CODE_MIN_HEIGHT = 8
+CODE_EXTRA_CHARACTERS = "/-.: "
+rec_charset = None
+
+def preprocess_off(gray):
+    return gray, 1
+
+def preprocess_fast(gray):
+    image_np = cv2.resize(gray, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
+    image_np = cv2.medianBlur(image_np, 3)
+    return image_np, 1.5
+
+def preprocess_balanced(gray):
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    image_np = clahe.apply(gray)
+    image_np = cv2.resize(image_np, None, fx=2, fy=2, interpolation=cv2.INTER_LINEAR)
+    image_np = cv2.adaptiveThreshold(image_np, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 21, 5)
+    return image_np, 2
+
+def preprocess_max_accuracy(gray):
+    image_np = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
     image_np = cv2.bilateralFilter(image_np, 9, 75, 75)
     image_np = cv2.adaptiveThreshold(image_np, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 2)
-    
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-        cv2.imwrite(temp_file.name, image_np)
-        result = ocr.ocr(temp_file.name, cls=True)
-    
-    os.remove(temp_file.name)
-    
-    numbers_with_conf = []
-    for line in result[0]:
-        if not line or len(line) < 2:
+    return image_np, 2
+
+PREPROCESSING_PROFILES = {
+    "off": preprocess_off,
+    "fast": preprocess_fast,
+    "balanced": preprocess_balanced,
+    "max_accuracy": preprocess_max_accuracy,
+}
+
+PROFILE_SCALES = {
+    "off": 1,
+    "fast": 1.5,
+    "balanced": 2,
+    "max_accuracy": 2,
+}
+
+def estimate_page_bytes(size, options):
+    width, height = size
+    scale = PROFILE_SCALES[options["preprocessing_profile"]]
+    return int(width * height * (1 + 4 * scale * scale))
+
+class MemoryBudget:
+    def __init__(self, limit_bytes):
+        self.limit = limit_bytes
+        self.in_flight = 0
+        self.peak = 0
+
+    def fits(self, nbytes):
+        return not self.limit or self.in_flight == 0 or self.in_flight + nbytes <= self.limit
+
+    def admit(self, nbytes):
+        self.in_flight += nbytes
+        self.peak = max(self.peak, self.in_flight)
+
+    def release(self, nbytes):
+        self.in_flight = max(0, self.in_flight - nbytes)
+
+def enhance_for_ocr(gray, profile="max_accuracy"):
+    return PREPROCESSING_PROFILES[profile](gray)
+
+def crop_line(image_bgr, box):
+    points = np.array(box, dtype=np.float32)
+    width = int(max(np.linalg.norm(points[0] - points[1]), np.linalg.norm(points[2] - points[3])))
+    height = int(max(np.linalg.norm(points[0] - points[3]), np.linalg.norm(points[1] - points[2])))
+    target = np.array([[0, 0], [width, 0], [width, height], [0, height]], dtype=np.float32)
+    matrix = cv2.getPerspectiveTransform(points, target)
+    crop = cv2.warpPerspective(image_bgr, matrix, (max(width, 1), max(height, 1)), borderMode=cv2.BORDER_REPLICATE, flags=cv2.INTER_CUBIC)
+    if crop.shape[0] >= crop.shape[1] * 1.5:
+        crop = np.ascontiguousarray(np.rot90(crop))
+    return crop
+
+def looks_like_code(w, h):
+    if h < CODE_MIN_HEIGHT:
+        return False
+    return CODE_ASPECT_RANGE[0] <= w / h <= CODE_ASPECT_RANGE[1]
+
+def detect_line_crops(roi_gray, page_info, options):
+    profile = options["preprocessing_profile"]
+    if options["ocr_mode"] != "coarse_to_fine":
+        image_np, scale = enhance_for_ocr(roi_gray, profile)
+        page_info["pixels"] = page_info.get("pixels", 0) + image_np.size
+        image_bgr = cv2.cvtColor(image_np, cv2.COLOR_GRAY2BGR)
+        detected, _ = ocr.text_detector(image_bgr)
+        if detected is None:
+            return []
+        detected = sorted(detected, key=lambda b: (b[0][1], b[0][0]))
+        if options["skip_non_code_lines"]:
+            detected = [box for box in detected if looks_like_code(*cv2.boundingRect(np.array(box, dtype=np.float32) / scale)[2:])]
+        return [([[x / scale, y / scale] for x, y in box], crop_line(image_bgr, box)) for box in detected]
+
+    coarse_scale = options["coarse_scale"]
+    coarse = cv2.resize(roi_gray, None, fx=coarse_scale, fy=coarse_scale, interpolation=cv2.INTER_AREA)
+    page_info["pixels"] = page_info.get("pixels", 0) + coarse.size
+    detected, _ = ocr.text_detector(cv2.cvtColor(coarse, cv2.COLOR_GRAY2BGR))
+
+    items = []
+    for box in detected if detected is not None else []:
+        x, y, w, h = cv2.boundingRect(np.array(box, dtype=np.float32) / coarse_scale)
+        if not looks_like_code(w, h):
             continue
-            
-        text_entry = line[1]
-        if not text_entry or len(text_entry) < 2: 
+        pad = max(h // 3, 2)
+        x1, y1 = max(x - pad, 0), max(y - pad, 0)
+        x2, y2 = min(x + w + pad, roi_gray.shape[1]), min(y + h + pad, roi_gray.shape[0])
+        crop, _ = enhance_for_ocr(roi_gray[y1:y2, x1:x2], profile)
+        page_info["pixels"] += crop.size
+        items.append(([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], cv2.cvtColor(crop, cv2.COLOR_GRAY2BGR)))
+    return items
+
+class ConstrainedCTCDecode:
+    def __init__(self, decoder, allowed_characters):
+        self.decoder = decoder
+        self.character = decoder.character
+        self.mask = np.array([i == 0 or char in allowed_characters for i, char in enumerate(decoder.character)])
+
+    def __call__(self, preds, *args, **kwargs):
+        if isinstance(preds, (tuple, list)):
+            preds = preds[-1]
+        if not isinstance(preds, np.ndarray):
+            preds = preds.numpy()
+        return self.decoder(np.where(self.mask, preds, 0), *args, **kwargs)
+
+def code_charset(prefixes):
+    return set("0123456789" + CODE_EXTRA_CHARACTERS + "".join(prefixes))
+
+def configure_rec_charset(charset=None):
+    global rec_charset
+    decoder = ocr.text_recognizer.postprocess_op
+    if isinstance(decoder, ConstrainedCTCDecode):
+        decoder = decoder.decoder
+    rec_charset = charset
+    ocr.text_recognizer.postprocess_op = decoder if charset is None else ConstrainedCTCDecode(decoder, charset)
+
+def recognize_crops(crops, cls=True):
+    if not crops:
+        return []
+    if cls:
+        crops, _, _ = ocr.text_classifier(crops)
+    recognized, _ = ocr.text_recognizer(crops)
+    return recognized
+
+class OCRBatch:
+    def __init__(self):
+        self.crops = []
+        self.owners = []
+
+    def add(self, owner, items):
+        for box, crop in items:
+            self.crops.append(crop)
+            self.owners.append((owner, box))
+
+    def recognize(self, cls=True):
+        lines = {}
+        for (owner, box), (text, conf) in zip(self.owners, recognize_crops(self.crops, cls)):
+            if conf >= ocr.drop_score:
+                lines.setdefault(owner, []).append((box, text, conf))
+        return lines
+
+def ocr_lines(roi_gray, page_info, options, cls=True):
+    batch = OCRBatch()
+    batch.add(0, detect_line_crops(roi_gray, page_info, options))
+    return batch.recognize(cls).get(0, [])
+
+def ocr_tile(tile_gray, options, cls=True, charset=None):
+    if charset != rec_charset:
+        configure_rec_charset(charset)
+    tile_info = {}
+    lines = ocr_lines(tile_gray, tile_info, options, cls)
+    return lines, tile_info.get("pixels", 0)
+
+def ocr_tile_window(handle, window, options, cls=True, charset=None):
+    x, y, tile_size = window
+    tile_gray = np.ascontiguousarray(attach_window(handle)[y:y + tile_size, x:x + tile_size])
+    return ocr_tile(tile_gray, options, cls, charset)
+
+def tile_offsets(length, tile_size, overlap):
+    step = max(tile_size - overlap, 1)
+    offsets = list(range(0, max(length - overlap, 1), step))
+    if offsets[-1] + tile_size < length:
+        offsets.append(length - tile_size)
+    return offsets
+
+def box_iou(box_a, box_b):
+    ax, ay, aw, ah = cv2.boundingRect(np.array(box_a, dtype=np.float32))
+    bx, by, bw, bh = cv2.boundingRect(np.array(box_b, dtype=np.float32))
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = iw * ih
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union else 0.0
+
+def merge_tile_lines(lines, iou_threshold=0.3):
+    merged = []
+    for box, text, conf in sorted(lines, key=lambda line: line[2], reverse=True):
+        if any(text == other_text and box_iou(box, other_box) > iou_threshold for other_box, other_text, other_conf in merged):
             continue
-            
-        text, conf = text_entry[0], text_entry[1]
+        merged.append((box, text, conf))
+    return merged
+
+def ocr_tiled(roi_gray, page_info, options, cls=True):
+    tile_size, overlap = options["tile_size"], options["tile_overlap"]
+    height, width = roi_gray.shape
+    offsets = [(x, y) for y in tile_offsets(height, tile_size, overlap) for x in tile_offsets(width, tile_size, overlap)]
+    tiles = [roi_gray[y:y + tile_size, x:x + tile_size] for x, y in offsets]
+
+    pool = get_worker_pool()
+    handle = spool_window(roi_gray) if pool is not None else None
+    if handle is not None:
+        windows = [(x, y, tile_size) for x, y in offsets]
+        results = pool.map(ocr_tile_window, repeat(handle), windows, repeat(options), repeat(cls), repeat(rec_charset))
+    elif pool is not None:
+        results = pool.map(ocr_tile, tiles, repeat(options), repeat(cls), repeat(rec_charset))
+    else:
+        results = map(ocr_tile, tiles, repeat(options), repeat(cls), repeat(rec_charset))
+
+    lines = []
+    for (x_off, y_off), (tile_lines, pixels) in zip(offsets, results):
+        page_info["pixels"] = page_info.get("pixels", 0) + pixels
+        lines.extend(([[x + x_off, y + y_off] for x, y in box], text, conf) for box, text, conf in tile_lines)
+    page_info["tiles"] = page_info.get("tiles", 0) + len(tiles)
+    return merge_tile_lines(lines)
+
+def roi_cascade(options, template_rois=None):
+    x_perc, y_perc = options["roi"]
+    levels = [("roi", [(tuple(x_perc), tuple(y_perc))])]
+    if template_rois:
+        levels.insert(0, ("template", template_rois))
+    if not options["roi_cascade_enabled"]:
+        return levels
+
+    strips = []
+    if y_perc[0] > 0:
+        strips.append(((0.00, 1.00), (0.00, y_perc[0])))
+    if y_perc[1] < 1:
+        strips.append(((0.00, 1.00), (y_perc[1], 1.00)))
+    if x_perc[0] > 0:
+        strips.append(((0.00, x_perc[0]), tuple(y_perc)))
+    if x_perc[1] < 1:
+        strips.append(((x_perc[1], 1.00), tuple(y_perc)))
+    if strips:
+        levels.append(("strips", strips))
+        levels.append(("full_page", [((0.00, 1.00), (0.00, 1.00))]))
+    return levels
+
+# ---- OCR ENGINES ---- #
+
+class OCREngine(ABC):
+    name = ""
+    batched = False
+
+    @abstractmethod
+    def read_region(self, roi_gray, page_info, options, cls=True):
+        pass
+
+class PaddleEngine(OCREngine):
+    name = "paddle"
+    batched = True
+
+    def read_region(self, roi_gray, page_info, options, cls=True):
+        if roi_gray.size > options["tile_max_pixels"]:
+            return ocr_tiled(roi_gray, page_info, options, cls)
+        return ocr_lines(roi_gray, page_info, options, cls)
+
+    def detect(self, roi_gray, page_info, options):
+        return detect_line_crops(roi_gray, page_info, options)
+
+class TesseractEngine(OCREngine):
+    name = "tesseract"
+
+    def read_region(self, roi_gray, page_info, options, cls=True):
+        if options["tesseract_cmd"]:
+            pytesseract.pytesseract.tesseract_cmd = options["tesseract_cmd"]
+        image_np, scale = enhance_for_ocr(roi_gray, options["preprocessing_profile"])
+        page_info["pixels"] = page_info.get("pixels", 0) + image_np.size
+
+        custom_config = r'--oem 3 --psm 11'
+        if rec_charset:
+            custom_config += " -c tessedit_char_whitelist=" + "".join(sorted(rec_charset - set(" ")))
+        try:
+            data = pytesseract.image_to_data(image_np, config=custom_config, output_type=pytesseract.Output.DICT)
+        except pytesseract.TesseractNotFoundError:
+            print("Tesseract non trovato, passo al motore successivo")
+            return []
+
+        lines = []
+        for text, conf, left, top, width, height in zip(data["text"], data["conf"], data["left"], data["top"], data["width"], data["height"]):
+            if not text.strip() or float(conf) < 0:
+                continue
+            x1, y1, x2, y2 = left / scale, top / scale, (left + width) / scale, (top + height) / scale
+            lines.append(([[x1, y1], [x2, y1], [x2, y2], [x1, y2]], text.strip(), float(conf) / 100))
+        return lines
+
+OCR_ENGINES = {
+    "tesseract": TesseractEngine(),
+    "paddle": PaddleEngine(),
+}
+
+def engine_cascade(options):
+    engines = [OCR_ENGINES[name] for name in options["ocr_engines"]]
+    inline = [engine for engine in engines if not engine.batched]
+    batched = [engine for engine in engines if engine.batched]
+    return inline + batched[:1]
+
+def region_confident(lines, combined_regex, threshold):
+    return any(conf >= threshold and extract_numbers(text, combined_regex) for box, text, conf in lines)
+
+def region_gray(gray, x_perc, y_perc):
+    height, width = gray.shape
+    x1, x2 = int(width * x_perc[0]), int(width * x_perc[1])
+    y1, y2 = int(height * y_perc[0]), int(height * y_perc[1])
+    return gray[y1:y2, x1:x2], (x1, y1)
+
+def add_region_or_fallback(lines, fallback, offset, combined_regex, numbers_with_conf, page_info, engine="paddle"):
+    found = add_region_numbers(lines, offset, combined_regex, numbers_with_conf, page_info, engine)
+    if not found and fallback:
+        fallback_lines, fallback_engine = fallback
+        found = add_region_numbers(fallback_lines, offset, combined_regex, numbers_with_conf, page_info, fallback_engine)
+    return found
+
+def add_region_numbers(lines, offset, combined_regex, numbers_with_conf, page_info, engine="paddle"):
+    found_before = len(numbers_with_conf)
+    for box, text, conf in lines:
+        page_info["texts"].append(text)
         found_numbers = extract_numbers(text, combined_regex)
+        page_box = [[int(x) + offset[0], int(y) + offset[1]] for x, y in box]
         
         for num in found_numbers:
+            if num in [n for n, c in numbers_with_conf]:
+                continue
             numbers_with_conf.append((num, float(conf))) 
+            page_info["boxes"].append((num, page_box, "ocr"))
+
+    found = len(numbers_with_conf) - found_before
+    if found:
+        page_info.setdefault("engines", {})
+        page_info["engines"][engine] = page_info["engines"].get(engine, 0) + found
+    return found
+
+def begin_page(image, combined_regex, page_info, options):
+    page_info.setdefault("texts", [])
+    page_info.setdefault("boxes", [])
+    page_info.setdefault("stages", [])
+
+    if isinstance(image, str):
+        image = cv2.cvtColor(np.array(Image.open(image).convert("RGB")), cv2.COLOR_RGB2GRAY)
+    page_info["size"] = (image.shape[1], image.shape[0])
+    numbers_with_conf = []
+
+    if options["barcode_enabled"]:
+        page_info["stages"].append("barcode")
+        for num, box in decode_barcodes(image, combined_regex):
+            if num not in [n for n, c in numbers_with_conf]:
+                numbers_with_conf.append((num, 1.0))
+                page_info["boxes"].append((num, box, "barcode"))
+        if numbers_with_conf:
+            page_info["engines"] = {"barcode": len(numbers_with_conf)}
+
+        expected_codes = options["auto_accept_expected_codes"]
+        if numbers_with_conf and (not expected_codes or len(numbers_with_conf) >= expected_codes):
+            return image, numbers_with_conf, True
+
+    return image, numbers_with_conf, False
+
+def image_to_numbers_batch(pages, combined_regex, options=None):
+    options = options or DEFAULT_CONFIG
+    cls = not options["page_orientation_enabled"]
+    stage = "ocr_coarse_to_fine" if options["ocr_mode"] == "coarse_to_fine" else "ocr"
+
+    states = []
+    for image, page_info, rois in pages:
+        image, numbers_with_conf, done = begin_page(image, combined_regex, page_info, options)
+        states.append({
+            "image": image,
+            "page_info": page_info,
+            "numbers": numbers_with_conf,
+            "rois": rois,
+            "levels": [] if done else roi_cascade(options, rois),
+            "check_flip": page_info.get("check_flip", False),
+        })
+
+    engines = engine_cascade(options)
+    threshold = options["engine_escalation_confidence"]
+
+    while any(state["levels"] for state in states):
+        batch = OCRBatch()
+        queued = {}
+        for state in states:
+            if not state["levels"]:
+                continue
+            level, regions = state["levels"].pop(0)
+            page_info = state["page_info"]
+            page_info["escalation"] = level
+            for region_idx, (x_perc, y_perc) in enumerate(regions):
+                roi_gray, offset = region_gray(state["image"], x_perc, y_perc)
+                fallback = None
+                for engine_idx, engine in enumerate(engines):
+                    last_engine = engine_idx == len(engines) - 1
+                    page_info["stages"].append(stage if engine.batched else engine.name)
+                    if engine.batched and roi_gray.size <= options["tile_max_pixels"]:
+                        owner = (id(state), region_idx)
+                        batch.add(owner, engine.detect(roi_gray, page_info, options))
+                        queued[owner] = (state, offset, fallback)
+                        break
+                    lines = engine.read_region(roi_gray, page_info, options, cls)
+                    if last_engine or region_confident(lines, combined_regex, threshold):
+                        add_region_or_fallback(lines, fallback, offset, combined_regex, state["numbers"], page_info, engine.name)
+                        break
+                    fallback = (lines, engine.name)
+
+        recognized = batch.recognize(cls)
+        for owner, (state, offset, fallback) in queued.items():
+            add_region_or_fallback(recognized.get(owner, []), fallback, offset, combined_regex, state["numbers"], state["page_info"])
+
+        for state in states:
+            check_flip, state["check_flip"] = state["check_flip"], False
+            if state["numbers"]:
+                state["levels"] = []
+            elif check_flip and is_upside_down(gray_thumbnail(state["image"])):
+                state["image"] = np.ascontiguousarray(np.rot90(state["image"], 2))
+                state["levels"] = roi_cascade(options, state["rois"])
+                state["page_info"]["flipped"] = True
+                state["page_info"]["stages"].append("flip")
+
+    return [state["numbers"] for state in states]
+
+def image_to_numbers(image_path, combined_regex, page_info=None, options=None, rois=None):
+    if page_info is None:
+        page_info = {}
+    return image_to_numbers_batch([(image_path, page_info, rois)], combined_regex, options)[0]
+
+def load_prefixes(preamble_path):
+    with open(preamble_path, "r") as f:
+        return [line.strip() for line in f if line.strip()]
+
+def build_combined_regex(preamble_path):
+    prefissi = load_prefixes(preamble_path)
     
-    return numbers_with_conf
+    regex_patterns = [f"{re.escape(pref)}.{{{10 - len(pref)}}}" for pref in prefissi]
+    return re.compile(r"^(" + "|".join(regex_patterns) + r")$")
+
+# ---- BENCHMARK ---- #
+
+def load_benchmark_set(folder):
+    with open(os.path.join(folder, "ground_truth.json"), "r") as f:
+        ground_truth = json.load(f)
+
+    pages = []
+    for filename in sorted(os.listdir(folder)):
+        path = os.path.join(folder, filename)
+        if filename.lower().endswith(".pdf"):
+            for page_idx, image in enumerate(pdf_to_images(path)):
+                key = f"{filename}_page{page_idx + 1}"
+                if key in ground_truth:
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_img:
+                        image.save(temp_img.name)
+                    pages.append((key, temp_img.name, set(ground_truth[key])))
+        elif filename in ground_truth:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(filename)[1]) as temp_img:
+                shutil.copy2(path, temp_img.name)
+            pages.append((filename, temp_img.name, set(ground_truth[filename])))
+    return pages
+
+def benchmark_options(pages, combined_regex, options):
+    elapsed = 0.0
+    pixels = 0
+    expected_total = found_total = correct_total = 0
+    for key, image_path, expected in pages:
+        page_info = {}
+        start = time.perf_counter()
+        numbers_with_conf = image_to_numbers(image_path, combined_regex, page_info, options)
+        elapsed += time.perf_counter() - start
+        pixels += page_info.get("pixels", 0)
+
+        found = {num for num, conf in numbers_with_conf}
+        expected_total += len(expected)
+        found_total += len(found)
+        correct_total += len(found & expected)
+
+    return {
+        "pages": len(pages),
+        "latency": elapsed / max(len(pages), 1),
+        "recall": correct_total / max(expected_total, 1),
+        "precision": correct_total / max(found_total, 1),
+        "pixels": pixels // max(len(pages), 1),
+    }
+
+def cleanup_benchmark_set(pages):
+    for key, image_path, expected in pages:
+        try:
+            os.remove(image_path)
+        except FileNotFoundError:
+            pass
+
+def prepare_benchmark(folder):
+    config = load_config()
+    combined_regex = build_combined_regex(config["preamble_file"])
+    configure_rec_charset(code_charset(load_prefixes(config["preamble_file"])) if config["restrict_charset"] else None)
+    return config, combined_regex, load_benchmark_set(folder)
+
+def path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+    return total
+
+def package_size(name):
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.origin is None:
+        return 0
+    return path_size(os.path.dirname(spec.origin))
+
+def run_backend_benchmark(folder):
+    config, combined_regex, pages = prepare_benchmark(folder)
+    backends = {
+        "paddle": {"package": "paddle", "models": [ocr.args.det_model_dir, ocr.args.rec_model_dir, ocr.args.cls_model_dir]},
+        "onnx": {"package": "onnxruntime", "models": [config["onnx_det_model"], config["onnx_rec_model"], config["onnx_cls_model"]], "excludes": ["paddle"]},
+    }
+    results = {}
+    try:
+        for backend, sizes in backends.items():
+            options = {**config, "barcode_enabled": False, "inference_backend": backend}
+            start = time.perf_counter()
+            configure_backend(options)
+            startup = time.perf_counter() - start
+            if ocr_backend[0] != backend:
+                print(f"{backend}: saltato")
+                continue
+            configure_rec_charset(code_charset(load_prefixes(config["preamble_file"])) if config["restrict_charset"] else None)
+            results[backend] = benchmark_options(pages, combined_regex, options)
+            results[backend]["startup"] = startup
+            results[backend]["install_size"] = package_size(sizes["package"])
+            results[backend]["install_size_excludes"] = sizes.get("excludes", [])
+            results[backend]["model_size"] = sum(path_size(path) for path in sizes["models"] if path and os.path.exists(path))
+            print(f"{backend}: {results[backend]}")
+    finally:
+        cleanup_benchmark_set(pages)
+    save_benchmark("inference_backends", results)
+    return results
+
+def validate_quantized_models(folder):
+    config = load_config()
+    models = [config["quantized_det_model"], config["quantized_rec_model"]]
+    missing = [model for model in models if not model or not os.path.exists(model)]
+    if missing:
+        print(f"Modelli quantizzati non trovati: {missing}")
+        return None
+
+    config, combined_regex, pages = prepare_benchmark(folder)
+    charset = code_charset(load_prefixes(config["preamble_file"])) if config["restrict_charset"] else None
+    try:
+        baseline_options = {**config, "barcode_enabled": False, "quantized_models_enabled": False}
+        configure_backend(baseline_options)
+        configure_rec_charset(charset)
+        baseline = benchmark_options(pages, combined_regex, baseline_options)
+
+        quantized_options = {**baseline_options, "quantized_models_enabled": True, "quantized_validated_models": models}
+        configure_backend(quantized_options)
+        configure_rec_charset(charset)
+        quantized = benchmark_options(pages, combined_regex, quantized_options)
+    finally:
+        cleanup_benchmark_set(pages)
+
+    accepted = quantized["recall"] >= config["quantized_min_recall"]
+    results = {
+        "models": models,
+        "baseline": baseline,
+        "quantized": quantized,
+        "speedup": baseline["latency"] / max(quantized["latency"], 1e-9),
+        "recall_delta": quantized["recall"] - baseline["recall"],
+        "min_recall": config["quantized_min_recall"],
+        "accepted": accepted,
+    }
+    save_benchmark("quantized_models", results)
+    update_config(quantized_models_enabled=accepted, quantized_validated_models=models if accepted else [])
+
+    print(f"Speedup INT8: {results['speedup']:.2f}x, delta recall: {results['recall_delta'] * 100:+.2f}%")
+    if accepted:
+        print("Modelli quantizzati validati e abilitati.")
+    else:
+        print(f"Modelli quantizzati rifiutati: recall {quantized['recall'] * 100:.2f}% sotto la soglia {config['quantized_min_recall'] * 100:.2f}%.")
+    return results
+
+def run_thread_benchmark(folder):
+    config, combined_regex, pages = prepare_benchmark(folder)
+    results = {}
+    try:
+        for strategy in CONCURRENCY_STRATEGIES[:-1]:
+            options = {**config, "barcode_enabled": False, "concurrency_strategy": strategy, "tile_max_pixels": 0}
+            start = time.perf_counter()
+            workers, threads = apply_thread_budget(options)
+            configure_backend(options)
+            pool = get_worker_pool()
+            if pool is not None:
+                list(pool.map(abs, range(workers)))
+            warmup = time.perf_counter() - start
+
+            stats = benchmark_options(pages, combined_regex, options)
+            results[strategy] = {
+                "workers": workers,
+                "worker_threads": threads,
+                "startup": warmup,
+                "pages_per_second": 1 / max(stats["latency"], 1e-9),
+                "recall": stats["recall"],
+            }
+            print(f"{strategy}: {results[strategy]}")
+    finally:
+        cleanup_benchmark_set(pages)
+        configure_worker_pool(1)
+
+    best = max(results, key=lambda strategy: results[strategy]["pages_per_second"])
+    save_benchmark("concurrency", {"best": best, "tiled": True, "strategies": results})
+    print(f"Strategia migliore sulle pagine a tile: {best} (imposta concurrency_strategy in config.json per usarla)")
+    return results
+
+def run_profile_benchmark(folder):
+    config, combined_regex, pages = prepare_benchmark(folder)
+    results = {}
+    try:
+        for profile in PREPROCESSING_PROFILES:
+            results[profile] = benchmark_options(pages, combined_regex, {**config, "barcode_enabled": False, "preprocessing_profile": profile})
+            print(f"{profile}: {results[profile]}")
+    finally:
+        cleanup_benchmark_set(pages)
+    save_benchmark("preprocessing_profiles", results)
+    return results
+
+def profile_label(profile, benchmark):
+    stats = benchmark.get("preprocessing_profiles", {}).get(profile)
+    if not stats:
+        return profile
+    return f"{profile} ({stats['latency']:.2f}s, {stats['recall'] * 100:.0f}%)"
+
+# ---- LAYOUT TEMPLATES ---- #
+
+LAYOUTS_FILE = os.path.join(get_base_path(), "layouts.json")
+
+
+def layout_fingerprint(thumb, size=32):
+    small = cv2.resize(thumb, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32).flatten()
+    small -= small.mean()
+    norm = np.linalg.norm(small)
+    return small / norm if norm else small
+
+def merge_rects(rects):
+    merged = []
+    for rect in sorted(rects, key=lambda r: (r[1][0], r[0][0])):
+        for i, other in enumerate(merged):
+            if rect[0][0] <= other[0][1] and other[0][0] <= rect[0][1] and rect[1][0] <= other[1][1] and other[1][0] <= rect[1][1]:
+                merged[i] = ((min(rect[0][0], other[0][0]), max(rect[0][1], other[0][1])),
+                             (min(rect[1][0], other[1][0]), max(rect[1][1], other[1][1])))
+                break
+        else:
+            merged.append(rect)
+    return merged
+
+class LayoutRegistry:
+    max_samples = 50
+
+    def __init__(self, path=LAYOUTS_FILE):
+        self.path = path
+        self.templates = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.templates = json.load(f)
+
+    def save(self):
+        with open(self.path, "w") as f:
+            json.dump(self.templates, f, indent=2)
+
+    def classify(self, fingerprint, page_text="", max_distance=0.15):
+        page_text = page_text.lower()
+        for name, template in self.templates.items():
+            if page_text and any(keyword.lower() in page_text for keyword in template.get("keywords", [])):
+                return name
+
+        best_name, best_distance = None, max_distance
+        for name, template in self.templates.items():
+            distance = float(simsimd.cosine(fingerprint, np.array(template["fingerprint"], dtype=np.float32)))
+            if distance <= best_distance:
+                best_name, best_distance = name, distance
+        return best_name
+
+    def has_keywords(self):
+        return any(template.get("keywords") for template in self.templates.values())
+
+    def rois(self, name):
+        if name not in self.templates:
+            return []
+        return [(tuple(x_perc), tuple(y_perc)) for x_perc, y_perc in self.templates[name]["rois"]]
+
+    def learn(self, name, fingerprint, rects):
+        if not rects:
+            return name
+        if name is None:
+            name = f"layout_{len(self.templates) + 1}"
+            self.templates[name] = {"fingerprint": fingerprint.tolist(), "keywords": [], "samples": [], "rois": []}
+
+        template = self.templates[name]
+        template["samples"] = (template["samples"] + [list(map(list, rect)) for rect in rects])[-self.max_samples:]
+
+        padded = []
+        for (x0, x1), (y0, y1) in template["samples"]:
+            pad_x, pad_y = (x1 - x0) * 0.10, (y1 - y0) * 0.75
+            padded.append(((max(x0 - pad_x, 0.0), min(x1 + pad_x, 1.0)), (max(y0 - pad_y, 0.0), min(y1 + pad_y, 1.0))))
+        template["rois"] = [list(map(list, rect)) for rect in merge_rects(padded)]
+        self.save()
+        return name
+
+# ---- FILE SCANNER ---- #
+
+SCAN_INDEX_FILE = os.path.join(get_base_path(), "scan_index.db")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff")
+SOURCE_EXTENSIONS = (".pdf", ".zip") + IMAGE_EXTENSIONS
+
+def scan_files(folder, extensions=SOURCE_EXTENSIONS, recursive=True, exclude=()):
+    excluded = {os.path.normcase(os.path.abspath(path)) for path in exclude if path}
+    stack = [folder]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive and os.path.normcase(os.path.abspath(entry.path)) not in excluded:
+                        stack.append(entry.path)
+                elif entry.name.lower().endswith(extensions):
+                    stat = entry.stat()
+                    yield os.path.abspath(entry.path), stat.st_size, stat.st_mtime_ns
+
+class FileIndex:
+    def __init__(self, path=SCAN_INDEX_FILE):
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, status TEXT)")
+        self.db.commit()
+
+    def pending(self, folder, extensions=SOURCE_EXTENSIONS, recursive=True, exclude=()):
+        known = {row[0]: row[1:] for row in self.db.execute("SELECT path, size, mtime, hash, status FROM files")}
+        found = []
+        for path, size, mtime in scan_files(folder, extensions, recursive, exclude):
+            entry = known.get(path)
+            if entry and entry[3] == "processed":
+                if entry[:2] == (size, mtime):
+                    continue
+                if entry[0] == size and file_sha256(path) == entry[2]:
+                    self.db.execute("UPDATE files SET mtime = ? WHERE path = ?", (mtime, path))
+                    continue
+            if entry is None or entry[:2] != (size, mtime):
+                self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, NULL, 'pending')", (path, size, mtime))
+            found.append(os.path.relpath(path, folder))
+        self.db.commit()
+        return sorted(found)
+
+    def mark_processed(self, paths, digests=None):
+        digests = digests or {}
+        rows = []
+        for path in paths:
+            path = os.path.abspath(path)
+            stat = os.stat(path)
+            rows.append((path, stat.st_size, stat.st_mtime_ns, digests.get(path) or file_sha256(path), "processed"))
+        self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", rows)
+        self.db.commit()
+
+# ---- PAGE SPOOL ---- #
+
+class PageSpool:
+    def __init__(self, capacity=64 * 1024 * 1024):
+        fd, self.path = tempfile.mkstemp(prefix="cmr_spool_", suffix=".bin")
+        os.close(fd)
+        self.data = np.memmap(path, dtype=np.uint8, mode="w+", shape=(capacity,))
+        self.index = {}
+        self.end = 0
+
+    def write(self, key, array):
+        nbytes = array.nbytes
+        if self.end + nbytes > len(self.data):
+            self.data.flush()
+            self.data = np.memmap(self.path, dtype=np.uint8, mode="r+", shape=(max(len(self.data) * 2, self.end + nbytes),))
+        self.data[self.end:self.end + nbytes] = array.reshape(-1)
+        self.index[key] = (self.end, array.shape)
+        self.end += nbytes
+
+    def read(self, key):
+        offset, shape = self.index[key]
+        return self.data[offset:offset + int(np.prod(shape))].reshape(shape)
+
+    def release(self, key):
+        del self.index[key]
+        if not self.index:
+            self.end = 0
+
+    def close(self):
+        self.index = {}
+        self.data = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+# ---- REVIEW STORE ---- #
+
+REVIEW_STORE_FILE = os.path.join(get_base_path(), "review_store.db")
+
+class ReviewStore:
+    max_age_days = 7
+
+    def __init__(self, path=REVIEW_STORE_FILE):
+        self.batch = uuid.uuid4().hex
+        self.db = sqlite3.connect(path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages (batch TEXT, key TEXT, created REAL, preview BLOB, scale REAL, page_info BLOB, PRIMARY KEY (batch, key))")
+        self.db.execute("DELETE FROM pages WHERE created < ?", (time.time() - self.max_age_days * 86400,))
+        self.db.commit()
+
+    def clear(self):
+        self.db.execute("DELETE FROM pages WHERE batch = ?", (self.batch,))
+        self.db.commit()
+
+    def put(self, key, preview, scale, page_info):
+        self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)", (self.batch, key, time.time(), preview, scale, pickle.dumps(page_info)))
+        self.db.commit()
+
+    def pop(self, key):
+        row = self.db.execute("SELECT preview, scale, page_info FROM pages WHERE batch = ? AND key = ?", (self.batch, key)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("DELETE FROM pages WHERE batch = ? AND key = ?", (self.batch, key))
+        self.db.commit()
+        preview, scale, page_info = row
+        return Image.open(io.BytesIO(preview)), scale, pickle.loads(page_info)
+
+# ---- BACKUP ---- #
+
+BACKUP_INDEX_NAME = "backup_index.json"
+FICLONE = 0x40049409
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def reflink(src, dst):
+    import fcntl
+    with open(src, "rb") as source, open(dst, "wb") as target:
+        fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    shutil.copystat(src, dst)
+
+def link_or_copy(src, dst, mode="auto"):
+    if mode == "auto":
+        for method, name in ((reflink, "reflink"), (os.link, "hardlink")):
+            try:
+                method(src, dst)
+                return name
+            except (OSError, ImportError):
+                if os.path.exists(dst):
+                    os.remove(dst)
+    shutil.copy2(src, dst)
+    return "copy"
+
+class BackupManager:
+    def __init__(self, backup_root, folder, mode="auto", workers=4):
+        self.backup_root = backup_root
+        self.folder = folder
+        self.mode = mode
+        self.index_path = os.path.join(backup_root, BACKUP_INDEX_NAME)
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                self.index = json.load(f)
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.futures = []
+        self.stats = {}
+        self.digests = {}
+
+    def submit(self, path, subfolder=""):
+        self.futures.append(self.executor.submit(self.backup_file, path, subfolder))
+
+    def submit_digest(self, path):
+        self.futures.append(self.executor.submit(self.record_digest, path))
+
+    def record_digest(self, path):
+        digest = file_sha256(path)
+        with self.lock:
+            self.digests[os.path.abspath(path)] = digest
+
+    def backup_file(self, path, subfolder=""):
+        folder = os.path.join(self.folder, subfolder)
+        os.makedirs(folder, exist_ok=True)
+        dest = os.path.join(folder, os.path.basename(path))
+        if os.path.exists(dest):
+            os.remove(dest)
+        digest = file_sha256(path)
+        with self.lock:
+            existing = self.index.get(digest)
+        if existing and os.path.exists(os.path.join(self.backup_root, existing)):
+            try:
+                os.link(os.path.join(self.backup_root, existing), dest)
+                method = "deduplicated"
+            except OSError:
+                method = "skipped"
+        else:
+            method = link_or_copy(path, dest, self.mode)
+        with self.lock:
+            if method != "skipped":
+                self.index.setdefault(digest, os.path.relpath(dest, self.backup_root))
+            self.stats[method] = self.stats.get(method, 0) + 1
+            self.digests[os.path.abspath(path)] = digest
+        return method
+
+    def wait(self):
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        self.executor.shutdown()
+        os.makedirs(self.backup_root, exist_ok=True)
+        with open(self.index_path, "w") as f:
+            json.dump(self.index, f, indent=2)
+        return self.stats
+
+class ZipBackup:
+    def __init__(self, backup_root, batch, manifest=True):
+        name = f"backup{batch}"
+        suffix = 1
+        while os.path.exists(os.path.join(backup_root, f"{name}.zip")):
+            suffix += 1
+            name = f"backup{batch}_{suffix}"
+        self.backup_root = backup_root
+        self.archive_path = os.path.join(backup_root, f"{name}.zip")
+        self.manifest = os.path.join(backup_root, f"{name}.manifest.jsonl") if manifest else None
+        self.archive = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.futures = []
+        self.stats = {}
+        self.digests = {}
+
+    def submit(self, path, subfolder=""):
+        self.futures.append(self.executor.submit(self.archive_file, path, subfolder))
+
+    def submit_digest(self, path):
+        self.futures.append(self.executor.submit(self.record_digest, path))
+
+    def record_digest(self, path):
+        self.digests[os.path.abspath(path)] = file_sha256(path)
+
+    def archive_file(self, path, subfolder=""):
+        arcname = "/".join(part for part in (subfolder.replace(os.sep, "/"), os.path.basename(path)) if part)
+        if self.archive is None:
+            os.makedirs(self.backup_root, exist_ok=True)
+            self.archive = zipfile.ZipFile(self.archive_path, "x", compression=zipfile.ZIP_STORED)
+        self.archive.write(path, arcname)
+        self.record_digest(path)
+        if self.manifest:
+            entry = {"name": arcname, "size": os.path.getsize(path), "sha256": self.digests[os.path.abspath(path)]}
+            with open(self.manifest, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+        self.stats["archived"] = self.stats.get("archived", 0) + 1
+
+    def wait(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.futures = []
+            self.executor.shutdown()
+            if self.archive is not None:
+                self.archive.close()
+                self.archive = None
+        return self.stats
 
 # ---- PROCESSOR CLASS ---- #
 
@@ -123,75 +1473,381 @@ class PDFProcessor:
     def __init__(self, root, progress_label):
         self.root = root
         self.combined_regex = ""
+        self.prefixes = []
         self.progress_label = progress_label
         self.folderpath = ""
         self.output_dir = ""
         self.backup_dir = ""
         self.pdf_files = []
         self.image_files = []
+        self.archive_files = []
+        self.file_index = None
         self.all_numbers = {}
         self.total_files = 0
         self.processed_files = 0
+        self.config = load_config()
+        self.auto_accepted = []
+        self.review_queued = []
+        self.skipped_blank = []
+        self.skipped_duplicate = []
+        self.page_results = []
+        self.page_hashes = []
+        self.page_hash_keys = []
+        self.page_bands = []
+        self.layouts = LayoutRegistry()
+        self.pending_pages = []
+        self.review_store = ReviewStore()
+        self.spool = None
+        self.backup = None
+        self.backup_stats = {}
+        self.memory = MemoryBudget(self.config["memory_budget_mb"] * 1024 * 1024)
+        apply_thread_budget(self.config)
+        configure_backend(self.config)
+
+    def filter_page(self, key, thumb):
+        if self.config["skip_blank_pages"] and ink_coverage(thumb) < self.config["blank_ink_threshold"]:
+            self.skipped_blank.append(key)
+            return True
+        return False
+
+    def start_document(self):
+        self.page_hashes = self.page_hashes[-1:]
+        self.page_hash_keys = self.page_hash_keys[-1:]
+        self.page_bands = self.page_bands[-1:]
+
+    def skip_duplicate(self, key, image, thumb):
+        if not self.config["skip_duplicate_pages"]:
+            return False
+
+        page_hash = perceptual_hash(thumb)
+        band = code_band(page_thumbnail(image, 1024))
+        if self.page_hashes:
+            distances = np.array(simsimd.cdist(page_hash[np.newaxis, :], np.stack(self.page_hashes), metric="hamming", dtype="b8"))[0]
+            for closest in np.argsort(distances):
+                if distances[closest] > self.config["duplicate_max_distance"]:
+                    break
+                difference = band_difference(band, self.page_bands[closest])
+                if difference <= self.config["duplicate_max_pixel_diff"]:
+                    self.skipped_duplicate.append({"page": key, "duplicate_of": self.page_hash_keys[closest], "difference": difference})
+                    return True
+
+        self.page_hashes.append(page_hash)
+        self.page_hash_keys.append(key)
+        self.page_bands.append(band)
+        return False
+
+    def orient_image(self, image, declared=False):
+        if not self.config["page_orientation_enabled"] or declared:
+            return image, 0
+        rotation = detect_orientation(image)
+        if rotation:
+            image = image.rotate(rotation, expand=True)
+        return image, rotation
+
+    def classify_layout(self, thumb, page_text=""):
+        page_info = {}
+        if self.config["layout_templates_enabled"]:
+            fingerprint = layout_fingerprint(thumb)
+            page_info["fingerprint"] = fingerprint
+            page_info["template"] = self.layouts.classify(fingerprint, page_text, self.config["layout_match_distance"])
+        return page_info
+
+    def add_pending_page(self, key, image, source_path, page_info):
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        gray = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2GRAY)
+        preview = page_preview(image, self.config["review_preview_max_side"], self.config["review_preview_quality"])
+        nbytes = estimate_page_bytes(image.size, self.config)
+        if not self.memory.fits(nbytes):
+            self.flush_pending_pages()
+        self.memory.admit(nbytes)
+        self.spool.write(key, gray)
+        self.pending_pages.append((key, preview, source_path, page_info, nbytes))
+        if len(self.pending_pages) >= self.config["ocr_batch_pages"]:
+            self.flush_pending_pages()
+
+    def flush_pending_pages(self):
+        if not self.pending_pages:
+            return
+        pages = [(self.spool.read(key), page_info, self.layouts.rois(page_info.get("template"))) for key, preview, source_path, page_info, nbytes in self.pending_pages]
+        results = image_to_numbers_batch(pages, self.combined_regex, self.config)
+        del pages
+        for (key, preview, source_path, page_info, nbytes), numbers_with_conf in zip(self.pending_pages, results):
+            if page_info.get("flipped"):
+                preview = rotate_preview(preview, self.config["review_preview_quality"])
+                page_info["orientation"] = (page_info["orientation"] + 180) % 360
+                page_info["source"]["rotation"] = (page_info["source"]["rotation"] + 180) % 360
+            self.queue_page(key, numbers_with_conf, preview, source_path, page_info)
+            self.spool.release(key)
+            self.memory.release(nbytes)
+        self.pending_pages = []
+
+    def backup_outputs(self, outputs):
+        if not self.config["backup_include_outputs"]:
+            return
+        for path in outputs:
+            self.backup.submit(path, os.path.join("output", os.path.relpath(os.path.dirname(path), self.output_dir)))
+
+    def page_confirmed(self, page_info, confirmed_numbers, outputs):
+        self.learn_layout(page_info, confirmed_numbers)
+        self.backup_outputs(outputs)
+
+    def learn_layout(self, page_info, confirmed_numbers):
+        if "fingerprint" not in page_info:
+            return
+        width, height = page_info["size"]
+        rects = []
+        for num, box, source in page_info["boxes"]:
+            if num in confirmed_numbers:
+                xs, ys = [p[0] for p in box], [p[1] for p in box]
+                rects.append(((min(xs) / width, max(xs) / width), (min(ys) / height, max(ys) / height)))
+        self.layouts.learn(page_info["template"], page_info["fingerprint"], rects)
+
+    def auto_accept_datetime(self, source_path, page_info):
+        if self.config["auto_accept_datetime_source"] == "ocr":
+            return extract_datetime(" ".join(page_info["texts"]))
+        return datetime.fromtimestamp(os.path.getmtime(source_path))
+
+    def try_auto_accept(self, key, numbers_with_conf, preview, source_path, page_info):
+        if not self.config["auto_accept_enabled"] or not numbers_with_conf:
+            return False
+
+        expected_codes = self.config["auto_accept_expected_codes"]
+        if expected_codes and len(numbers_with_conf) != expected_codes:
+            return False
+
+        if any(conf < self.config["auto_accept_min_confidence"] for num, conf in numbers_with_conf):
+            return False
+
+        accepted_at = self.auto_accept_datetime(source_path, page_info)
+        if accepted_at is None:
+            return False
+
+        numbers = [num for num, conf in numbers_with_conf]
+        output_dir = os.path.join(self.output_dir, os.path.splitext(key)[0])
+        outputs = save_pod_pdfs(Image.open(io.BytesIO(preview[0])), output_dir, numbers, accepted_at.strftime("%Y%m%d%H%M") + "00")
+        self.backup_outputs(outputs)
+
+        self.auto_accepted.append({
+            "page": key,
+            "codes": numbers,
+            "min_confidence": min(conf for num, conf in numbers_with_conf),
+            "datetime": accepted_at.isoformat(),
+        })
+        return True
+
+    def queue_page(self, key, numbers_with_conf, preview, source_path, page_info):
+        if not self.try_auto_accept(key, numbers_with_conf, preview, source_path, page_info):
+            self.review_store.put(key, preview[0], preview[1], page_info)
+            self.all_numbers[key] = numbers_with_conf
+            self.review_queued.append(key)
+        self.page_results.append({
+            "page": key,
+            "template": page_info.get("template"),
+            "orientation": page_info.get("orientation", 0),
+            "codes": len(numbers_with_conf),
+            "stages": page_info["stages"],
+            "escalation": page_info.get("escalation"),
+            "pixels": page_info.get("pixels", 0),
+            "tiles": page_info.get("tiles", 0),
+            "input_scale": page_info.get("input_scale", 1.0),
+            "engines": page_info.get("engines", {}),
+        })
+
+    def escalation_counts(self):
+        counts = {}
+        for result in self.page_results:
+            level = result["escalation"] or "barcode"
+            counts[level] = counts.get(level, 0) + 1
+        return counts
+
+    def engine_hits(self):
+        hits = {}
+        for result in self.page_results:
+            for engine, codes in result["engines"].items():
+                hits[engine] = hits.get(engine, 0) + codes
+        return hits
+
+    def write_batch_report(self, timestamp):
+        report = {
+            "created": datetime.now().isoformat(),
+            "files": self.total_files,
+            "auto_accepted": self.auto_accepted,
+            "review_queued": self.review_queued,
+            "skipped_blank": self.skipped_blank,
+            "skipped_duplicate": self.skipped_duplicate,
+            "escalations": self.escalation_counts(),
+            "engine_hits": self.engine_hits(),
+            "memory_peak_mb": round(self.memory.peak / (1024 * 1024), 1),
+            "backup": self.backup_stats,
+            "pages": self.page_results,
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        report_path = os.path.join(self.output_dir, f"report{timestamp}.json")
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        return report_path
+
+    def prepare_pdf_page(self, filename, source, page_idx, image, page_meta):
+        key = f"{filename}_page{page_idx + 1}"
+        thumb = page_thumbnail(image)
+        if self.filter_page(key, thumb) or self.skip_duplicate(key, image, thumb):
+            return
+        image, rotation = self.orient_image(image, declared=page_meta["rotation"] != 0)
+        if rotation:
+            thumb = page_thumbnail(image)
+        print(f"{page_idx}: {image}")
+        page_info = self.classify_layout(thumb, page_meta["text"])
+        page_info["orientation"] = page_meta["rotation"] or rotation
+        page_info["check_flip"] = self.config["page_orientation_enabled"] and page_meta["rotation"] == 0
+        page_info["source"] = dict(source, page=page_idx, rotation=rotation)
+        self.add_pending_page(key, image, source["path"], page_info)
+
+    def process_pdf_document(self, filename, pdf, source):
+        self.start_document()
+        pages = pdf_page_info(pdf, with_text=self.layouts.has_keywords())
+        print("Elenco immagini:")
+        for page_idx, image in enumerate(iter_pdf_pages(pdf)):
+            self.prepare_pdf_page(filename, source, page_idx, image, pages[page_idx])
+
+    def process_image_document(self, filename, image_file, source):
+        self.start_document()
+        text_scale = None
+        if self.config["photo_normalization_enabled"]:
+            text_scale = probe_text_scale(image_file, self.config["target_text_height"])
+        if hasattr(image_file, "seek"):
+            image_file.seek(0)
+        with Image.open(image_file) as source_image:
+            frames = getattr(source_image, "n_frames", 1) if source_image.format == "TIFF" else 1
+            for frame_idx in range(frames):
+                source_image.seek(frame_idx)
+                key = filename if frames == 1 else f"{filename}_page{frame_idx + 1}"
+                exif_rotated = source_image.getexif().get(0x0112, 1) != 1
+                frame = decode_page(source_image, self.config["image_max_side"], text_scale)
+                image = ImageOps.exif_transpose(frame) if exif_rotated else frame
+                thumb = page_thumbnail(image)
+                if self.filter_page(key, thumb) or self.skip_duplicate(key, image, thumb):
+                    continue
+                image, rotation = self.orient_image(image, declared=exif_rotated)
+                if rotation:
+                    thumb = page_thumbnail(image)
+                page_info = self.classify_layout(thumb)
+                page_info["orientation"] = rotation
+                page_info["check_flip"] = self.config["page_orientation_enabled"] and not exif_rotated
+                page_info["input_scale"] = 1.0 if text_scale is None else text_scale
+                page_info["source"] = dict(source, page=frame_idx, rotation=rotation, max_side=self.config["image_max_side"], text_scale=text_scale)
+                self.add_pending_page(key, image, source["path"], page_info)
+
+    def process_archive(self, filename, archive_path):
+        with zipfile.ZipFile(archive_path) as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                name = safe_member_name(member.filename)
+                if not name:
+                    continue
+                source = {"path": archive_path, "member": member.filename}
+                if name.lower().endswith(".pdf"):
+                    self.process_pdf_document(f"{filename}/{name}", archive.read(member), source)
+                elif name.lower().endswith(IMAGE_EXTENSIONS):
+                    self.process_image_document(f"{filename}/{name}", io.BytesIO(archive.read(member)), source)
+
+    def advance_progress(self):
+        self.processed_files += 1
+        self.progress_label.config(text=f"Elaborati: {self.processed_files} / {self.total_files}")
+        self.progress_label.update()
 
     def process_pdfs(self):
-        self.total_files = len(self.pdf_files + self.image_files)
+        configure_rec_charset(code_charset(self.prefixes) if self.config["restrict_charset"] else None)
+        self.total_files = len(self.pdf_files + self.archive_files + self.image_files)
         self.processed_files = 0
+        self.auto_accepted = []
+        self.review_queued = []
+        self.skipped_blank = []
+        self.skipped_duplicate = []
+        self.page_results = []
+        self.page_hashes = []
+        self.page_hash_keys = []
+        self.page_bands = []
+        self.memory = MemoryBudget(self.config["memory_budget_mb"] * 1024 * 1024)
+        self.all_numbers = {}
+        self.review_store.clear()
+        if self.spool is None:
+            self.spool = PageSpool()
+        batch = datetime.now().strftime("%Y%m%d_%H%M")
+        if self.config["backup_mode"] == "zip":
+            self.backup = ZipBackup(self.backup_dir, batch, self.config["backup_manifest"])
+        else:
+            self.backup = BackupManager(self.backup_dir, os.path.join(self.backup_dir, f"backup{batch}"), self.config["backup_link_mode"], self.config["backup_workers"])
         self.progress_label.config(text=f"Elaborati: 0 / {self.total_files}")
         self.progress_label.update()
 
         for filename in self.pdf_files:
             pdf_path = os.path.join(self.folderpath, filename)
-            images = pdf_to_images(pdf_path)
-            print("Elenco immagini:")
-            if images:
-                for page_idx, image in enumerate(images):
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                        print(f"{page_idx}: {image}")
-                        image.save(temp_img.name)
-                        numbers_with_conf = image_to_numbers(temp_img.name, self.combined_regex)
-                        key = f"{filename}_page{page_idx + 1}"
-                        self.all_numbers[key] = (numbers_with_conf, temp_img.name)
-            self.processed_files += 1
-            self.progress_label.config(text=f"Elaborati: {self.processed_files} / {self.total_files}")
-            self.progress_label.update()
+            self.process_pdf_document(filename, pdf_path, {"path": pdf_path, "member": None})
+            self.backup.submit(pdf_path, os.path.dirname(filename))
+            self.advance_progress()
+
+        for filename in self.archive_files:
+            archive_path = os.path.join(self.folderpath, filename)
+            self.process_archive(filename, archive_path)
+            self.backup.submit(archive_path, os.path.dirname(filename))
+            self.advance_progress()
 
         for filename in self.image_files:
             img_path = os.path.join(self.folderpath, filename)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as temp_img:
-                shutil.copy2(img_path, temp_img.name)
-                numbers_with_conf = image_to_numbers(temp_img.name, self.combined_regex)
-                self.all_numbers[filename] = (numbers_with_conf, temp_img.name)
-            self.processed_files += 1
-            self.progress_label.config(text=f"Elaborati: {self.processed_files} / {self.total_files}")
-            self.progress_label.update()
+            self.process_image_document(filename, img_path, {"path": img_path, "member": None})
+            if self.file_index is not None:
+                self.backup.submit_digest(img_path)
+            self.advance_progress()
+
+        self.flush_pending_pages()
 
     def process_next_pdf(self):
         if not self.all_numbers:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M")
-            os.makedirs(f"{self.backup_dir}//backup{timestamp}", exist_ok=True)
-            
-            for filename in self.pdf_files:
-                shutil.copy2(os.path.join(self.folderpath, filename), f"{self.backup_dir}//backup{timestamp}")
-
-            messagebox.showinfo("Completato", "Tutti i PDF sono stati elaborati.")
+            self.backup_stats = self.backup.wait()
+            if self.file_index is not None:
+                self.file_index.mark_processed([os.path.join(self.folderpath, f) for f in self.pdf_files + self.archive_files + self.image_files], self.backup.digests)
+
+            self.write_batch_report(timestamp)
+            if self.spool is not None:
+                self.spool.close()
+                self.spool = None
+            messagebox.showinfo("Completato", (
+                "Tutti i PDF sono stati elaborati.\n"
+                f"Accettati automaticamente: {len(self.auto_accepted)}\n"
+                f"Pagine vuote saltate: {len(self.skipped_blank)}\n"
+                f"Pagine duplicate saltate: {len(self.skipped_duplicate)}"
+            ))
             return
 
         filename = next(iter(self.all_numbers))
-        numbers, image_path = self.all_numbers[filename]
-        del self.all_numbers[filename]
+        numbers = self.all_numbers.pop(filename)
+        stored = self.review_store.pop(filename)
+        if stored is None:
+            return self.process_next_pdf()
+        preview, scale, page_info = stored
         
-        ReviewWindow(self.root, numbers, image_path, 
+        ReviewWindow(self.root, numbers, preview, 
                     os.path.join(self.output_dir, os.path.splitext(filename)[0]),
                     self.folderpath,  
-                    filename, self.process_next_pdf)
+                    filename, self.process_next_pdf, page_info["boxes"],
+                    lambda numbers, outputs: self.page_confirmed(page_info, numbers, outputs),
+                    scale, lambda: load_source_page(page_info["source"]))
 
 # ---- REVIEW WINDOW CLASS ---- #
 
 class ReviewWindow:
-    def __init__(self, root, numbers_with_conf, image_path, output_dir, input_dir, pdf_filename, callback):
+    def __init__(self, root, numbers_with_conf, preview, output_dir, input_dir, pdf_filename, callback, boxes=None, confirm_callback=None, preview_scale=1.0, load_full=None):
         self.root = root
+        self.boxes = boxes
+        self.confirm_callback = confirm_callback
         self.numbers_with_conf = numbers_with_conf
-        self.image_path = image_path
+        self.preview = preview
+        self.preview_scale = preview_scale
+        self.load_full = load_full
+        self.full_loaded = False
         self.output_dir = output_dir
         self.input_dir = input_dir
         self.pdf_filename = pdf_filename
@@ -245,8 +1901,8 @@ class ReviewWindow:
         tk.Button(controls_frame, text="Zoom +", command=lambda: self.zoom_with_button(1.1)).pack(side=tk.LEFT, padx=5)
         tk.Button(controls_frame, text="Zoom -", command=lambda: self.zoom_with_button(0.9)).pack(side=tk.LEFT, padx=5)
 
-        numbers_to_highlight = [num for num, conf in self.numbers_with_conf]
-        self.img = self.load_and_highlight_image(self.image_path, numbers_to_highlight)
+        self.numbers_to_highlight = [num for num, conf in self.numbers_with_conf]
+        self.img = self.load_and_highlight_image(self.preview, self.numbers_to_highlight, self.preview_scale)
         self.update_canvas_image()
 
         self.canvas.bind("<MouseWheel>", self.zoom_with_mouse)
@@ -281,11 +1937,18 @@ class ReviewWindow:
         tk.Button(buttons_frame, text="Conferma", command=self.confirm).pack(side=tk.LEFT, padx=10)
         tk.Button(buttons_frame, text="Annulla", command=self.cancel).pack(side=tk.RIGHT, padx=10)
 
-    def load_and_highlight_image(self, image_path, numbers_to_highlight):
-        image = Image.open(image_path).convert("RGB")
+    def load_and_highlight_image(self, image, numbers_to_highlight, scale=1.0):
+        image = image.convert("RGB")
         draw = ImageDraw.Draw(image)
 
-        result = ocr.ocr(image_path, cls=True)[0]
+        if self.boxes is not None:
+            for num, bbox, source in self.boxes:
+                if num in numbers_to_highlight:
+                    bbox = [(int(p[0] * scale), int(p[1] * scale)) for p in bbox]
+                    draw.polygon(bbox, outline="green" if source == "barcode" else "red", width=3)
+            return image
+
+        result = ocr.ocr(cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR), cls=True)[0] or []
 
         for line in result:
             if not line:
@@ -298,6 +1961,13 @@ class ReviewWindow:
 
         return image
     
+    def ensure_full_resolution(self):
+        if self.full_loaded or self.load_full is None or self.scale_factor <= 1:
+            return
+        self.img = self.load_and_highlight_image(self.load_full(), self.numbers_to_highlight)
+        self.scale_factor *= self.preview_scale
+        self.full_loaded = True
+
     def update_canvas_image(self):
         resized_img = self.img.resize((int(self.img.width * self.scale_factor), int(self.img.height * self.scale_factor)), Image.LANCZOS)
         self.img_tk = ImageTk.PhotoImage(resized_img)
@@ -309,10 +1979,12 @@ class ReviewWindow:
     def zoom_with_mouse(self, event):
         factor = 1.1 if event.delta > 0 else 0.9
         self.scale_factor = min(max(self.scale_factor * factor, 0.1), 10)
+        self.ensure_full_resolution()
         self.update_canvas_image()
 
     def zoom_with_button(self, factor):
         self.scale_factor = min(max(self.scale_factor * factor, 0.1), 10)
+        self.ensure_full_resolution()
         self.update_canvas_image()
 
     def start_pan(self, event):
@@ -374,12 +2046,10 @@ class ReviewWindow:
         selected_time = f"{hours:02.0f}{minutes:02.0f}00"
 
 
-        for frame in self.entries:
-            entry = frame.winfo_children()[1]
-            number = entry.get()
-            if number.strip():
-                output_pdf = os.path.join(self.output_dir, f"POD_{number}_{formatted_date+selected_time}.pdf")
-                save_image_as_pdf_pil(self.image_path, output_pdf)
+        numbers = [frame.winfo_children()[1].get() for frame in self.entries]
+        outputs = save_pod_pdfs(self.preview, self.output_dir, numbers, formatted_date + selected_time)
+        if self.confirm_callback:
+            self.confirm_callback([number.strip() for number in numbers if number.strip()], outputs)
 
         self.cleanup_and_next()
 
@@ -388,10 +2058,6 @@ class ReviewWindow:
 
     def cleanup_and_next(self):
         self.win.destroy()
-        try:
-            os.remove(self.image_path)
-        except FileNotFoundError:
-            pass
         self.callback()
     
     def validate_input(self, P, min_value, max_value, *args):
@@ -475,6 +2141,7 @@ def ask_license():
 # ---- MAIN ---- #
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
 
     def choose_source_folder():
         folder = filedialog.askdirectory(title="Seleziona cartella PDF")
@@ -506,20 +2173,24 @@ if __name__ == "__main__":
             messagebox.showwarning("Attenzione", "Seleziona entrambe le cartelle.")
             return
         save_config(validation_url, source, output, preamble, backup)
-        with open(preamble, "r") as f:
-            prefissi = [line.strip() for line in f if line.strip()]
-        
-        regex_patterns = [f"{re.escape(pref)}.{{{10 - len(pref)}}}" for pref in prefissi]
-        combined_regex = re.compile(r"^(" + "|".join(regex_patterns) + r")$")
+        update_config(preprocessing_profile=profile_names[selected_profile.get()], ocr_engines=ENGINE_MIXES[selected_engines.get()])
+        combined_regex = build_combined_regex(preamble)
 
         processor = PDFProcessor(root, progress_label)
         processor.folderpath = source
         processor.output_dir = output
         processor.backup_dir = backup
         processor.combined_regex = combined_regex
-        processor.pdf_files = [f for f in os.listdir(source) if f.lower().endswith(".pdf")]
-        image_extensions = ('.png', '.jpg', '.jpeg')
-        processor.image_files = [f for f in os.listdir(source) if f.lower().endswith(image_extensions)]
+        processor.prefixes = load_prefixes(preamble)
+        recursive = processor.config["scan_recursive"]
+        if processor.config["scan_incremental"]:
+            processor.file_index = FileIndex()
+            files = processor.file_index.pending(source, recursive=recursive, exclude=(output, backup))
+        else:
+            files = sorted(os.path.relpath(path, source) for path, size, mtime in scan_files(source, recursive=recursive, exclude=(output, backup)))
+        processor.pdf_files = [f for f in files if f.lower().endswith(".pdf")]
+        processor.archive_files = [f for f in files if f.lower().endswith(".zip")]
+        processor.image_files = [f for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
         processor.process_pdfs()
         processor.process_next_pdf()
 
@@ -588,6 +2259,16 @@ if __name__ == "__main__":
 
 
 
+    benchmarks = {
+        "--benchmark": run_profile_benchmark,
+        "--benchmark-backends": run_backend_benchmark,
+        "--validate-quantized": validate_quantized_models,
+        "--benchmark-threads": run_thread_benchmark,
+    }
+    if len(sys.argv) > 2 and sys.argv[1] in benchmarks:
+        benchmarks[sys.argv[1]](sys.argv[2])
+        sys.exit()
+
     root = tk.Tk()
     root.withdraw() 
 
@@ -598,9 +2279,12 @@ if __name__ == "__main__":
         messagebox.showerror("Licenza non valida", "Impossibile avviare l'app: licenza non valida o scaduta.")
         sys.exit()
 
+    if backend_warning:
+        messagebox.showwarning("Attenzione", backend_warning)
+
     root.deiconify()
     root.title("Estrai Codici e Crea PDF")
-    root.geometry("500x500")
+    root.geometry("500x620")
 
     config = load_config()
 
@@ -626,6 +2310,17 @@ if __name__ == "__main__":
     tk.Entry(root, textvariable=selected_backup, width=50).pack()
     tk.Button(root, text="Scegli Cartella Backup", command=choose_backup_folder).pack(pady=5)
 
+    benchmark = load_benchmark()
+    profile_names = {profile_label(profile, benchmark): profile for profile in PREPROCESSING_PROFILES}
+    selected_profile = tk.StringVar(value=profile_label(config["preprocessing_profile"], benchmark))
+    tk.Label(root, text="Profilo preprocessing:").pack(pady=5)
+    tk.OptionMenu(root, selected_profile, *profile_names).pack()
+
+    engine_mix = next((label for label, engines in ENGINE_MIXES.items() if engines == config["ocr_engines"]), "PaddleOCR")
+    selected_engines = tk.StringVar(value=engine_mix)
+    tk.Label(root, text="Motore OCR:").pack(pady=5)
+    tk.OptionMenu(root, selected_engines, *ENGINE_MIXES).pack()
+
     tk.Button(root, text="Conferma ed Elabora", command=start_processing, width=30).pack(pady=20)
     tk.Button(root, text="About", command=show_about_window).pack(side="bottom", pady=10)
 